@@ -1,19 +1,43 @@
 # app.py — background-thread sender (free-plan friendly)
 import os
+import io
+import re
 import csv
+import codecs
+import gzip
+import zlib
+import mmap
 import json
 import uuid
 import time
+import random
+import queue
 import threading
-from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import orjson
+from datetime import datetime, timezone
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from twilio.rest import Client
 import phonenumbers
 from threading import Lock
 import base64
 from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, ConnectTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from db import (DATA_DIR, JOB_COLUMNS, JOB_LEASE_COLUMNS, get_db, close_db, init_db,
+                insert_rows, row_to_dict, get_wallet_mills)
 
 
+# advisory file locks (POSIX); without them every caller is treated as the only process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # optional google sheets support
 try:
     import gspread
@@ -22,41 +46,44 @@ try:
 except Exception:
     GS_ENABLED = False
 
+# optional numpy support (vectorized segment counting for large estimates)
+try:
+    import numpy as np
+    NP_ENABLED = True
+except Exception:
+    NP_ENABLED = False
+
 # to track running jobs (prevent duplicate worker threads for same job)
 running_jobs = set()
+running_jobs_lock = Lock()
 
 
-# --- App setup ---
-app = Flask(__name__, template_folder='templates', static_folder='static')
-BASE_DIR = os.path.dirname(__file__)
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
-
-WALLET_PATH = os.path.join(DATA_DIR, 'wallet.json')
-JOBS_PATH = os.path.join(DATA_DIR, 'jobs.json')
-RECIPS_PATH = os.path.join(DATA_DIR, 'recipients.json')
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON through orjson: request bodies are parsed and responses encoded in
+    native code, straight to bytes. Output stays compact (even under debug=True, the
+    UI polls /api/job every 2s) with sorted keys, like the default provider.
+    """
+    option = orjson.OPT_SORT_KEYS
 
-def ensure_file(path, default):
-    if not os.path.exists(path):
-        with open(path, 'w', encoding='utf8') as f:
-            json.dump(default, f, indent=2)
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
 
-# initialize data files (wallet uses mills: 1 mill = $0.001)
-ensure_file(WALLET_PATH, {"balance_mills": 100000})
-ensure_file(JOBS_PATH, [])
-ensure_file(RECIPS_PATH, [])
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
-fs_lock = Lock()
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option), mimetype=self.mimetype)
 
-def read_json(path):
-    with open(path, 'r', encoding='utf8') as f:
-        return json.load(f)
 
-def write_json_atomic(path, data):
-    tmp = path + '.tmp'
-    with open(tmp, 'w', encoding='utf8') as f:
-        json.dump(data, f, indent=2)
-    os.replace(tmp, path)
+# --- App setup ---
+app = Flask(__name__, template_folder='templates', static_folder='static')
+app.json = OrjsonProvider(app)
+# largest request body accepted, compressed or not; werkzeug answers 413 above it
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_BYTES') or 32 * 1024 * 1024)
+init_db()
 
 # ---------- Google Sheets wallet sync helpers ----------
 def init_gs_client_from_env():
@@ -87,82 +114,208 @@ def init_gs_client_from_env():
         print("[gsheet] init error:", e)
         return None
 
-def read_wallet_from_sheet():
+# authorized client + opened spreadsheet, built on first use and reused: each rebuild
+# costs an OAuth handshake and an open_by_key round trip (gspread refreshes the token itself)
+_gs_sheet = None
+_gs_lock = Lock()
+
+def get_wallet_sheet():
     """
-    Reads wallet_mills from Google Sheet cell specified by GOOGLE_WALLET_RANGE (default Wallet!A1).
-    Returns None on failure.
+    Returns the cached gspread Spreadsheet for GOOGLE_SHEET_ID, or None if not configured.
     """
-    try:
-        gc = init_gs_client_from_env()
-        if not gc:
-            return None
-        sheet_id = os.getenv('GOOGLE_SHEET_ID')
-        rng = os.getenv('GOOGLE_WALLET_RANGE', 'Wallet!A1')
-        sh = gc.open_by_key(sheet_id)
-        resp = sh.values_get(rng)
-        values = resp.get('values', [])
-        if not values or not values[0] or not values[0][0]:
-            return None
-        text = values[0][0]
-        mills = int(float(text))
-        return mills
-    except Exception as e:
-        print("[gsheet] read error:", e)
-        return None
+    global _gs_sheet
+    with _gs_lock:
+        if _gs_sheet is None:
+            gc = init_gs_client_from_env()
+            if gc:
+                _gs_sheet = gc.open_by_key(os.getenv('GOOGLE_SHEET_ID'))
+        return _gs_sheet
+
+def reset_wallet_sheet():
+    # forget the cached handle after an error so the next call re-authorizes
+    global _gs_sheet
+    with _gs_lock:
+        _gs_sheet = None
 
 def write_wallet_to_sheet(mills: int):
     """
     Writes wallet_mills to Google Sheet.
     """
     try:
-        gc = init_gs_client_from_env()
-        if not gc:
+        sh = get_wallet_sheet()
+        if not sh:
             return False
-        sheet_id = os.getenv('GOOGLE_SHEET_ID')
         rng = os.getenv('GOOGLE_WALLET_RANGE', 'Wallet!A1')
-        sh = gc.open_by_key(sheet_id)
         sh.values_update(rng, params={'valueInputOption': 'USER_ENTERED'}, body={'values': [[str(mills)]]})
         return True
     except Exception as e:
         print("[gsheet] write error:", e)
+        reset_wallet_sheet()
         return False
 
+# The local database is the authoritative wallet; the sheet is a mirror updated in the
+# background so no request waits on a Google API round trip. Balance changes wake the
+# sync thread; the interval timer retries after failures.
+SHEET_SYNC_INTERVAL_S = int(os.getenv('SHEET_SYNC_INTERVAL_S', '60'))
+_sheet_sync_wakeup = threading.Event()
+_sheet_sync_pid = None
+_sheet_sync_lock = Lock()
+
+def sheet_sync_loop():
+    last_synced = None
+    while True:
+        _sheet_sync_wakeup.wait(SHEET_SYNC_INTERVAL_S)
+        _sheet_sync_wakeup.clear()
+        try:
+            mills = get_wallet_mills(get_db())
+            if mills != last_synced and write_wallet_to_sheet(mills):
+                last_synced = mills
+        except Exception as e:
+            print("[gsheet] sync error:", e)
+
+def request_sheet_sync():
+    """Schedules a push of the local balance to the sheet (no-op when sheets aren't configured)."""
+    global _sheet_sync_pid
+    if not GS_ENABLED or not os.getenv('GOOGLE_SHEET_ID'):
+        return
+    with _sheet_sync_lock:
+        # one sync thread per process (threads don't survive a gunicorn fork)
+        if _sheet_sync_pid != os.getpid():
+            _sheet_sync_pid = os.getpid()
+            threading.Thread(target=sheet_sync_loop, name='sheet-sync', daemon=True).start()
+    _sheet_sync_wakeup.set()
+
 
 # Twilio client (if env set)
 TW_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
 TW_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
 TW_FROM = os.getenv('TWILIO_FROM', '')
 PUBLIC_WEBHOOK = os.getenv('PUBLIC_WEBHOOK_URL', '')
-tw_client = None
-if TW_SID and TW_TOKEN:
-    tw_client = Client(TW_SID, TW_TOKEN)
+# when set, messages go through the Messaging Service (sender pool + Twilio-side queueing) instead of TWILIO_FROM
+TW_MESSAGING_SERVICE = os.getenv('TWILIO_MESSAGING_SERVICE_SID', '')
+
+class RecordingHttpClient(TwilioHttpClient):
+    """
+    TwilioHttpClient that remembers each thread's last response, so the retry
+    loop can read headers such as Retry-After (TwilioRestException has none).
+    """
+    _local = threading.local()
+
+    def request(self, *args, **kwargs):
+        self._local.response = None
+        response = super().request(*args, **kwargs)
+        self._local.response = response
+        return response
+
+    def last_response_headers(self):
+        response = getattr(self._local, 'response', None)
+        return (response.headers if response is not None else None) or {}
+
+def retry_after_seconds():
+    """Retry-After from this thread's last Twilio response, in seconds, or None."""
+    if not tw_client:
+        return None
+    value = tw_client.http_client.last_response_headers().get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff
+
+def build_twilio_client():
+    """
+    Twilio client backed by one keep-alive requests.Session shared by every worker
+    thread, with a connection pool big enough that concurrent sends reuse warm
+    TLS connections instead of handshaking per message.
+    """
+    http = RecordingHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT_S)
+    http.session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=TWILIO_POOL_SIZE))
+    return Client(TW_SID, TW_TOKEN, http_client=http)
 
 ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
 
 # constants
 PRICE_PER_SMS_MILLS = 23   # $0.023
 ALLOWED_REGION = 'CA'
+E164 = phonenumbers.PhoneNumberFormat.E164
+
+# Canadian area codes (NPAs) accepted without a full phonenumbers parse
+CA_NPAS = frozenset({
+    '204', '226', '236', '249', '250', '263', '289', '306', '343', '354',
+    '365', '367', '368', '382', '403', '416', '418', '428', '431', '437',
+    '438', '450', '468', '474', '506', '514', '519', '548', '579', '581',
+    '584', '587', '604', '613', '639', '647', '672', '683', '705', '709',
+    '742', '753', '778', '780', '782', '807', '819', '825', '867', '873',
+    '902', '905',
+})
+# optional +1 / 1, then NPA-NXX-XXXX with common separators; ASCII digits only, other
+# scripts' digits fall through to the cleaning + phonenumbers path
+_CA_FAST_RE = re.compile(r'^(?:\+1|1)?[\s\-().]*([2-9]\d{2})[\s\-().]*([2-9]\d{2})[\s\-().]*(\d{4})$', re.ASCII)
+# everything except digits and '+', stripped in one C-level pass
+_CLEAN = re.compile(r'[^\d+]')
 SEND_DELAY_MS = int(os.getenv('SEND_DELAY_MS', '250'))
+# send rate per process (msg/s); defaults to the old one-per-SEND_DELAY_MS pace, 0 = unpaced.
+# every gunicorn worker paces on its own, so the account sees WEB_CONCURRENCY times this
+SEND_MPS = float(os.getenv('SEND_MPS') or (1000.0 / SEND_DELAY_MS if SEND_DELAY_MS > 0 else 0))
+SEND_CONCURRENCY = max(1, int(os.getenv('SEND_CONCURRENCY', '8')))  # in-flight Twilio calls per job
+# sends allowed back-to-back after an idle spell (token bucket depth); 1 = strict spacing
+SEND_BURST = max(1, int(os.getenv('SEND_BURST', '1')))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS') or min(8, os.cpu_count() or 1))  # jobs sending at once
+# keep-alive connections to api.twilio.com: one per sender that can be in flight, so a
+# full burst never overflows the pool (overflow connections are closed after one use)
+TWILIO_POOL_SIZE = int(os.getenv('TWILIO_POOL_SIZE') or SEND_CONCURRENCY * JOB_WORKERS)
+# seconds to wait on api.twilio.com (connect, and between bytes of the response);
+# without it a hung socket blocks its sender thread forever
+TWILIO_TIMEOUT_S = float(os.getenv('TWILIO_TIMEOUT_S', '30'))
+# a process owns the jobs it sends for this long past its last heartbeat; after that
+# the job counts as orphaned (its process died) and another process may take it over
+JOB_LEASE_S = int(os.getenv('JOB_LEASE_S', '60'))
+JOB_HEARTBEAT_S = JOB_LEASE_S / 4
+
+tw_client = None
+if TW_SID and TW_TOKEN:
+    tw_client = build_twilio_client()
+# accepted phone column names, in priority order
+PHONE_COLUMNS = ('phone', 'phone_number', 'mobile', 'msisdn')
+# (single-message limit, per-part limit when concatenated), keyed by is_gsm7()
+SEGMENT_LIMITS = {True: (160, 153), False: (70, 67)}
+MMAP_UPLOAD_BYTES = 500 * 1024  # werkzeug spools uploads larger than this to a temp file
+# cap on a gzip body once decompressed: a few MB of gzip can expand to gigabytes
+MAX_CSV_BYTES = int(os.getenv('MAX_CSV_BYTES') or 128 * 1024 * 1024)
 MAX_IMMEDIATE_RETRIES = 3  # per-recipient immediate retry attempts for transient errors
+# Twilio MessageStatus -> our recipient status (others only update twilioStatus)
+TWILIO_STATUS_MAP = {'delivered': 'delivered', 'failed': 'failed', 'undelivered': 'failed', 'sent': 'sent'}
+# the same mapping as a SQL CASE, so a callback is a single UPDATE with the raw status bound twice
+STATUS_UPDATE_SET = (
+    'twilioStatus = ?1, status = CASE ?1 '
+    + ' '.join(f"WHEN '{k}' THEN '{v}'" for k, v in TWILIO_STATUS_MAP.items())
+    + ' ELSE status END, updatedAt = ?2'
+)
 
 # helpers
 def is_gsm7(text: str) -> bool:
-    for ch in text or '':
-        if ord(ch) > 127:
-            return False
-    return True
+    # str.isascii() scans the string buffer in C instead of per-char in Python
+    return (text or '').isascii()
 
 def segments_for_text(text: str) -> int:
     txt = text or ''
     l = len(txt)
-    if is_gsm7(txt):
-        if l <= 160:
-            return 1
-        return (l + 152) // 153
-    else:
-        if l <= 70:
-            return 1
-        return (l + 66) // 67
+    # is_gsm7() inlined: this runs once per row on large estimates
+    single, chunk = SEGMENT_LIMITS[txt.isascii()]
+    return 1 if l <= single else (l + chunk - 1) // chunk
+
+def segments_for_texts(texts) -> list:
+    """
+    Segment counts for a batch of messages, same rules as segments_for_text.
+    Uses numpy array math when available, otherwise falls back to the scalar helper.
+    """
+    if not NP_ENABLED or not texts:
+        return [segments_for_text(t) for t in texts]
+    lens = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    ascii_mask = np.fromiter((t.isascii() for t in texts), dtype=bool, count=len(texts))
+    single = np.where(ascii_mask, SEGMENT_LIMITS[True][0], SEGMENT_LIMITS[False][0])
+    chunk = np.where(ascii_mask, SEGMENT_LIMITS[True][1], SEGMENT_LIMITS[False][1])
+    segs = np.where(lens <= single, 1, (lens + chunk - 1) // chunk)
+    return segs.tolist()
 
 def normalize_phone_and_check_canada(raw: str, default_region: str = 'CA'):
     """
@@ -175,10 +328,19 @@ def normalize_phone_and_check_canada(raw: str, default_region: str = 'CA'):
     """
     if not raw:
         return None, 'empty phone'
-    raw = str(raw).strip()
+    return _normalize_phone_cached(str(raw).strip(), default_region)
+
+
+@lru_cache(maxsize=131072)
+def _normalize_phone_cached(raw: str, default_region: str):
+    # memoized: bulk lists repeat numbers within and across uploads
+    # fast path: plain NANP formatting with a known Canadian area code
+    m = _CA_FAST_RE.match(raw)
+    if m and m.group(1) in CA_NPAS:
+        return '+1' + m.group(1) + m.group(2) + m.group(3), None
 
     # Remove common separators and keep digits and leading '+'
-    cleaned = ''.join(ch for ch in raw if ch.isdigit() or ch == '+')
+    cleaned = _CLEAN.sub('', raw)
 
     # Auto-add plus/country code rules:
     if not cleaned.startswith('+'):
@@ -189,19 +351,262 @@ def normalize_phone_and_check_canada(raw: str, default_region: str = 'CA'):
         elif len(cleaned) == 11 and cleaned.startswith('1'):
             cleaned = '+' + cleaned
         # else leave as-is (phonenumbers may still parse it)
+    elif not cleaned.startswith('+1'):
+        # explicit non-NANP country code: can't be Canadian, skip the parser entirely
+        return None, 'not a Canadian number (country code is not +1)'
+
+    # second fast path, for inputs the regex above didn't accept (other separators,
+    # tel: prefixes...): after cleaning it's plain +1 NPA NXX XXXX with a Canadian NPA
+    if (len(cleaned) == 12 and cleaned.startswith('+1') and cleaned.isascii()
+            and cleaned[2:].isdigit() and cleaned[2:5] in CA_NPAS and cleaned[5] in '23456789'):
+        return cleaned, None
 
     try:
         pn = phonenumbers.parse(cleaned, None)
+        # one metadata walk for the accept path (validity + region fused); limited to
+        # Canadian area codes so shared NANP ranges (toll-free etc.) keep the old region check
+        if (str(pn.national_number)[:3] in CA_NPAS
+                and phonenumbers.is_valid_number_for_region(pn, ALLOWED_REGION)):
+            return phonenumbers.format_number(pn, E164), None
+        # slow path: area codes missing from CA_NPAS (new overlays etc.) still pass on region
         if not phonenumbers.is_valid_number(pn):
             return None, 'invalid phone number'
         region = phonenumbers.region_code_for_number(pn)
-        if region != ALLOWED_REGION:
-            return None, f'not a Canadian number (region={region})'
-        return phonenumbers.format_number(pn, phonenumbers.PhoneNumberFormat.E164), None
+        if region == ALLOWED_REGION:
+            return phonenumbers.format_number(pn, E164), None
+        return None, f'not a Canadian number (region={region})'
     except Exception:
         return None, 'could not parse phone number'
 
 
+def warm_phonenumbers_metadata():
+    """
+    phonenumbers loads region metadata lazily, so the first parse is much slower
+    than later ones. Touch the NANP/CA metadata once at import (shared by preloaded
+    gunicorn workers) instead of on the first estimate request.
+    """
+    try:
+        pn = phonenumbers.parse('+16045551234', None)
+        phonenumbers.is_valid_number(pn)
+        phonenumbers.region_code_for_number(pn)
+        phonenumbers.format_number(pn, E164)
+    except Exception:
+        pass
+
+warm_phonenumbers_metadata()
+
+
+@lru_cache(maxsize=64)
+def placeholder_pattern(fieldnames: tuple):
+    """
+    Compile one regex matching any {{column}} placeholder for a CSV header.
+    Cached on the header tuple so uploads with the same columns reuse it.
+    Returns None when the header has no usable column names.
+    """
+    keys = [k for k in fieldnames if k]
+    if not keys:
+        return None
+    return re.compile(r'\{\{(' + '|'.join(re.escape(k) for k in keys) + r')\}\}')
+
+def template_parts(template: str, fieldnames: tuple):
+    """
+    Splits the template once into [literal, key, literal, key, ..., literal] for this header.
+    Returns None when there is nothing to substitute. Not cached: it runs once per
+    request, and the template is arbitrary client input of up to a whole request body.
+    """
+    placeholder_re = placeholder_pattern(fieldnames)
+    if placeholder_re is None or '{{' not in template:
+        return None
+    parts = placeholder_re.split(template)
+    return parts if len(parts) > 1 else None
+
+def template_renderer(template: str, fieldnames):
+    """
+    Returns row -> message, compiled once per request: rendering a row is a single
+    join over the pre-split literals and that row's values, with no rescanning.
+    """
+    parts = template_parts(template, tuple(fieldnames or ()))
+    if parts is None:
+        return lambda row: template
+    head = parts[0]
+    pairs = tuple(zip(parts[1::2], parts[2::2]))  # (key, literal that follows it)
+
+    def render(row):
+        out = [head]
+        for key, literal in pairs:
+            out.append(row.get(key) or '')
+            out.append(literal)
+        return ''.join(out)
+    return render
+
+def phone_getter(fieldnames):
+    """
+    Returns row -> raw phone string, bound once per CSV header. When only one of
+    PHONE_COLUMNS is present (the usual case) this is a single dict lookup per row.
+    """
+    keys = tuple(k for k in PHONE_COLUMNS if k in (fieldnames or ()))
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda r: r.get(key) or ''
+    return lambda r: next((r[k] for k in keys if r.get(k)), '')
+
+def read_csv_rows(csv_text: str):
+    """
+    Returns (fieldnames, iterator of rows) for CSV text; rows are dicts of strings.
+    """
+    # parse incrementally from one buffer instead of materializing a list of lines
+    reader = csv.DictReader(io.StringIO(csv_text))
+    return reader.fieldnames, iter(reader)
+
+def gunzip_capped(data: bytes, limit: int):
+    """
+    Decompresses a gzip body without ever producing more than `limit` bytes.
+    Returns None when the output would exceed it; raises zlib.error/EOFError on a
+    corrupt or truncated stream.
+    """
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    out = d.decompress(data, limit + 1)
+    if len(out) > limit or d.unconsumed_tail:
+        return None
+    if not d.eof:
+        raise EOFError('compressed body ended before the end-of-stream marker')
+    return out
+
+def read_upload_text(storage) -> str:
+    """
+    Decodes an uploaded CSV file. Uploads big enough to have been spooled to disk are
+    mapped and decoded straight from the page cache instead of read() into a bytes copy.
+    """
+    stream = storage.stream
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size >= MMAP_UPLOAD_BYTES:
+        try:
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return str(m, 'utf-8-sig')
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass  # not backed by a real file; fall through
+    return stream.read().decode('utf-8-sig')
+
+class CSVTooLarge(Exception):
+    """A streamed CSV body grew past MAX_CSV_BYTES."""
+
+def iter_lines_capped(f, limit: int):
+    """
+    Yields the byte lines of a file-like object, raising CSVTooLarge once more than
+    `limit` bytes have been read. Each readline is bounded too, so a gzip stream with
+    no newlines can't inflate into one giant line.
+    """
+    remaining = limit
+    while True:
+        line = f.readline(remaining + 1)
+        if not line:
+            return
+        remaining -= len(line)
+        if remaining < 0:
+            raise CSVTooLarge(f'CSV larger than {limit} bytes')
+        yield line
+
+def read_csv_stream(stream):
+    """
+    Returns (fieldnames, iterator of rows) parsed lazily from an iterable of text lines,
+    so rows are validated while the rest of the body is still arriving and the
+    whole file is never held in memory. fieldnames is None for an empty stream.
+    """
+    reader = csv.DictReader(stream)
+    return reader.fieldnames, iter(reader)
+
+def iter_nonempty_rows(rows):
+    # skip blank lines / rows where every cell is empty
+    for r in rows:
+        if any(v.strip() for v in r.values() if isinstance(v, str)):
+            yield r
+
+def classify_rows(rows, get_phone, render_message, default_country):
+    """
+    One pass over the rows: normalize the phone, drop repeats of an already-seen
+    number and pick the message (the row's own, else the rendered template).
+    Yields (phone, message, row, None) for accepted rows and (None, None, row, reason)
+    for rejected ones. csv.Error from a malformed file propagates to the caller.
+    """
+    seen_phones = set()
+    for r in iter_nonempty_rows(rows):
+        raw_phone = get_phone(r).strip()
+        if not raw_phone:
+            yield None, None, r, 'phone missing'
+            continue
+        phone, err = normalize_phone_and_check_canada(raw_phone, default_country)
+        if err:
+            yield None, None, r, err
+            continue
+        # dedupe per job: keep only the first occurrence of a number
+        if phone in seen_phones:
+            continue
+        seen_phones.add(phone)
+        message = (r.get('message') or '').strip()
+        if not message:
+            message = render_message(r)
+        yield phone, message, r, None
+
+NDJSON_CHUNK_LINES = 256  # lines per write when streaming an estimate
+
+def stream_estimate_ndjson(classified):
+    """
+    Yields an estimate as newline-delimited JSON: one {"row": ...} or {"rejected": ...}
+    line per input row, then a final totals line (or an {"error": ...} line).
+    """
+    buf = []
+    total_segments = 0
+    try:
+        for phone, message, r, reason in classified:
+            if reason is not None:
+                buf.append(orjson.dumps({'rejected': {'row': r, 'reason': reason}}))
+            else:
+                seg = segments_for_text(message)
+                total_segments += seg
+                buf.append(orjson.dumps({'row': {'phone': phone, 'message': message,
+                                                 'original': r, 'segments': seg}}))
+            if len(buf) >= NDJSON_CHUNK_LINES:
+                yield b'\n'.join(buf) + b'\n'
+                buf = []
+    except (CSVTooLarge, csv.Error, UnicodeDecodeError, OSError, EOFError, zlib.error) as e:
+        error = str(e) if isinstance(e, CSVTooLarge) else 'CSV parse error: ' + str(e)
+        buf.append(orjson.dumps({'error': error}))
+        yield b'\n'.join(buf) + b'\n'
+        return
+    total_cost_mills = total_segments * PRICE_PER_SMS_MILLS
+    buf.append(orjson.dumps({'totalSegments': total_segments, 'totalCost_mills': total_cost_mills,
+                             'totalCost_usd': mills_to_usd_string(total_cost_mills)}))
+    yield b'\n'.join(buf) + b'\n'
+
+def uuid4_batch(n: int) -> list:
+    """
+    n random UUID4 strings from a single os.urandom call
+    (same format as str(uuid.uuid4()), without building UUID objects).
+    """
+    buf = bytearray(os.urandom(16 * n))
+    for i in range(0, 16 * n, 16):
+        buf[i + 6] = (buf[i + 6] & 0x0F) | 0x40  # version 4
+        buf[i + 8] = (buf[i + 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hx = buf.hex()
+    return [f"{hx[i:i+8]}-{hx[i+8:i+12]}-{hx[i+12:i+16]}-{hx[i+16:i+20]}-{hx[i+20:i+32]}"
+            for i in range(0, len(hx), 32)]
+
+_now_iso_cache = (None, '')
+
+def utc_now_iso() -> str:
+    # e.g. 2024-05-01T12:34:56Z (datetime.utcnow() is deprecated since 3.12).
+    # second resolution, so the string is formatted once per second and shared
+    # by every send/claim/callback in that second
+    global _now_iso_cache
+    sec = int(time.time())
+    cached_sec, text = _now_iso_cache
+    if cached_sec != sec:
+        text = datetime.fromtimestamp(sec, timezone.utc).isoformat().replace('+00:00', 'Z')
+        _now_iso_cache = (sec, text)
+    return text
+
 def mills_to_usd_string(mills: int) -> str:
     dollars = mills / 1000.0
     return f"${dollars:,.3f}"
@@ -209,143 +614,418 @@ def mills_to_usd_string(mills: int) -> str:
 # -----------------------
 # Background job processor
 # -----------------------
+class RateLimiter:
+    """
+    Token bucket shared by all sender threads: `rate` tokens/s, holding at most `burst`.
+    Pacing is on call start time, so a slow Twilio response does not delay the next send.
+    """
+    def __init__(self, rate, burst=1):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.burst = max(1, burst)
+        self._lock = Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            # an idle bucket refills up to `burst` tokens, never more
+            slot = max(self._next, now - (self.burst - 1) * self.interval)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def defer(self, seconds):
+        """Push the next start slot out by `seconds` from now, for every thread."""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+send_limiter = RateLimiter(SEND_MPS, SEND_BURST)
+
+# sender + callback arguments are the same for every message; build them once
+TW_SEND_KWARGS = {'messaging_service_sid': TW_MESSAGING_SERVICE} if TW_MESSAGING_SERVICE else {'from_': TW_FROM}
+if PUBLIC_WEBHOOK:
+    TW_SEND_KWARGS['status_callback'] = PUBLIC_WEBHOOK.rstrip('/') + '/api/twilio/status'
+
+
+def request_never_sent(exc) -> bool:
+    """
+    True when a requests error certainly happened before the POST went out: a connect
+    timeout, or no connection could be opened at all (DNS failure, refused...). Anything
+    else (reset or aborted after the body was written, stale keep-alive connection,
+    read timeout) may have reached Twilio.
+    """
+    if isinstance(exc, ConnectTimeout):
+        return True
+    reason = exc.args[0] if exc.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+def send_to_recipient(rec):
+    """
+    Send one claimed recipient, retrying transient errors. Returns
+    (id, segments, twilio_sid, sent_at, error); the job thread writes it.
+    """
+    if not tw_client:
+        return rec['id'], rec['segments'] or 1, None, None, 'Twilio not configured'
+    last_err = None
+    backoff_base = 1.0
+    for attempt in range(MAX_IMMEDIATE_RETRIES + 3):  # allow a couple more attempts for transient 429/5xx
+        try:
+            send_limiter.acquire()
+            msg = tw_client.messages.create(
+                body=rec['message'],
+                to=rec['phone'],
+                **TW_SEND_KWARGS
+            )
+            return rec['id'], rec['segments'] or 1, getattr(msg, 'sid', None), utc_now_iso(), None
+        except TwilioRestException as e:
+            last_err = str(e)
+            status_code = getattr(e, 'status', None)
+            # Rate limit or server error → wait (as told by Retry-After, else exponential
+            # backoff capped at 30s) and retry; jitter keeps senders from retrying in lockstep
+            if status_code == 429 or (status_code is not None and 500 <= status_code < 600):
+                wait_s = retry_after_seconds()
+                if wait_s is None:
+                    wait_s = min(backoff_base * (2 ** attempt), 30)
+                wait_s *= random.uniform(0.8, 1.2)
+                print(f"[worker-thread] Twilio transient (status={status_code}), retrying after {wait_s:.1f}s (attempt {attempt+1})")
+                if status_code == 429:
+                    # account-wide limit: hold back every sender in this process, not just this one;
+                    # acquire() on the retry waits out the deadline
+                    send_limiter.defer(wait_s)
+                else:
+                    time.sleep(wait_s)
+                continue
+            # other 4xx (invalid number, opted out, ...) won't succeed on retry
+            break
+        except RequestException as e:
+            if not request_never_sent(e):
+                # the POST may have reached Twilio and created the message: Twilio has no
+                # idempotency key for message creation, so retrying could send it twice
+                last_err = f'no response from Twilio, not retried: {e}'
+                break
+            last_err = str(e)
+            # couldn't connect: nothing was sent, small jittered wait then retry
+            time.sleep((0.5 + attempt * 0.5) * random.uniform(0.8, 1.2))
+            continue
+        except Exception as e:
+            # anything else (e.g. the SDK failing on a 201 response) may come after the
+            # message was created, so it isn't retried either
+            last_err = f'send failed, not retried: {e}'
+            break
+    return rec['id'], rec['segments'] or 1, None, None, last_err
+
+
+def acquire_job(conn, job_id):
+    """
+    Takes ownership of an unfinished job for this process. Succeeds when the job is
+    unowned, already ours, or its owner's lease has run out (the owner died); rows the
+    dead owner left 'sending' are handed back to the queue. Returns False when another
+    live process owns the job or it has already completed.
+    """
+    now = time.time()
+    pid = os.getpid()
+    with conn:
+        cur = conn.execute(
+            "UPDATE jobs SET ownerPid = ?, leaseUntil = ? WHERE id = ? AND status != 'completed'"
+            ' AND (ownerPid IS NULL OR ownerPid = ? OR leaseUntil < ?)',
+            (pid, now + JOB_LEASE_S, job_id, pid, now))
+        if cur.rowcount == 0:
+            return False
+        # running_jobs guarantees no thread of ours is sending for it, so these were interrupted
+        conn.execute("UPDATE recipients SET status = 'queued' WHERE jobId = ? AND status = 'sending'", (job_id,))
+    return True
+
+def renew_job_lease(conn, job_id) -> bool:
+    """Extends this process's lease on a job; False if another process has taken it over."""
+    return conn.execute('UPDATE jobs SET leaseUntil = ? WHERE id = ? AND ownerPid = ?',
+                        (time.time() + JOB_LEASE_S, job_id, os.getpid())).rowcount == 1
+
 def process_job(job_id):
     """
     Robust worker:
-      - ensures single thread per job via running_jobs set
-      - marks recipient 'sending' inside fs_lock to avoid duplicates
+      - ensures single thread per job via running_jobs set, and a single process via
+        the job's lease (renewed every JOB_HEARTBEAT_S while sending)
+      - claims recipients and marks them 'sending' in one UPDATE to avoid duplicates
+      - keeps up to SEND_CONCURRENCY sends in flight, paced by send_limiter (SEND_MPS)
+      - records finished sends and claims their replacements in the same transaction
       - retries transient errors with exponential backoff, handles rate limit 429
-      - throttles with SEND_DELAY_MS between sends (ms)
+      - finalizes (and refunds) at most once, from the recipients' stored statuses
     """
-    if job_id in running_jobs:
-        print(f"[worker-thread] job {job_id} already running, skipping start")
-        return
-    running_jobs.add(job_id)
-    print(f"[worker-thread] Starting job {job_id}")
-    sent_segments = 0
-    failed_segments = 0
-
+    with running_jobs_lock:
+        if job_id in running_jobs:
+            print(f"[worker-thread] job {job_id} already running, skipping start")
+            return
+        running_jobs.add(job_id)
     try:
-        while True:
-            with fs_lock:
-                recips_all = read_json(RECIPS_PATH)
-                next_rec = next((r for r in recips_all if r.get('jobId') == job_id and r.get('status') == 'queued'), None)
-                if not next_rec:
-                    break
-                # mark it as sending immediately to prevent duplicates
-                for r in recips_all:
-                    if r.get('id') == next_rec.get('id'):
-                        r['status'] = 'sending'
-                        r['attempts'] = r.get('attempts', 0) + 1
-                        r['lastAttemptAt'] = datetime.utcnow().isoformat() + 'Z'
-                        write_json_atomic(RECIPS_PATH, recips_all)
-                        break
-                rec_id = next_rec.get('id')
-                phone = next_rec.get('phone')
-                msg_text = next_rec.get('message')
-                segs = next_rec.get('segments', 1)
-
-            # perform send with smarter retry strategy
-            success = False
-            last_err = None
-            backoff_base = 1.0
-            for attempt in range(MAX_IMMEDIATE_RETRIES + 3):  # allow a couple more attempts for transient 429/5xx
-                try:
-                    if not tw_client:
-                        raise RuntimeError('Twilio not configured')
-                    msg = tw_client.messages.create(
-                        body=msg_text,
-                        to=phone,
-                        from_=TW_FROM,
-                        status_callback=(PUBLIC_WEBHOOK.rstrip('/') + '/api/twilio/status') if PUBLIC_WEBHOOK else None
-                    )
-                    success = True
-                    tw_sid = getattr(msg, 'sid', None)
-                    with fs_lock:
-                        recips_all = read_json(RECIPS_PATH)
-                        target = next((x for x in recips_all if x.get('id') == rec_id), None)
-                        if target:
-                            target['twilioSid'] = tw_sid
-                            target['status'] = 'sent'
-                            target['lastSend'] = datetime.utcnow().isoformat() + 'Z'
-                            write_json_atomic(RECIPS_PATH, recips_all)
-                    sent_segments += segs
-                    break
-                except Exception as e:
-                    last_err = str(e)
-                    # If TwilioRestException, inspect status code for 429 / 5xx
-                    if isinstance(e, TwilioRestException):
-                        status_code = getattr(e, 'status', None)
-                        # Rate limit or server error → exponential backoff and retry
-                        if status_code == 429 or (status_code is not None and 500 <= status_code < 600):
-                            wait = backoff_base * (2 ** attempt)
-                            # cap wait to 30s
-                            wait = min(wait, 30)
-                            print(f"[worker-thread] Twilio transient (status={status_code}), retrying after {wait:.1f}s (attempt {attempt+1})")
-                            time.sleep(wait)
-                            continue
-                    # For other exceptions: small jittered wait then retry immediate attempts
-                    time.sleep(0.5 + attempt * 0.5)
-                    continue
-
-            if not success:
-                with fs_lock:
-                    recips_all = read_json(RECIPS_PATH)
-                    target = next((x for x in recips_all if x.get('id') == rec_id), None)
-                    if target:
-                        target['lastError'] = last_err
-                        target['status'] = 'failed'
-                        write_json_atomic(RECIPS_PATH, recips_all)
-                failed_segments += segs
-
-            # throttle between sends (ensure at least SEND_DELAY_MS)
-            time.sleep(SEND_DELAY_MS / 1000.0)
-
-        # finalize job
-        with fs_lock:
-            jobs = read_json(JOBS_PATH)
-            job = next((j for j in jobs if j.get('id') == job_id), None)
-            if job:
-                reserved_mills = job.get('totalCost_mills', 0)
-                actual_cost_mills = sent_segments * PRICE_PER_SMS_MILLS
-                refund_mills = max(0, reserved_mills - actual_cost_mills)
-                if refund_mills > 0:
-                    wallet = read_json(WALLET_PATH)
-                    wallet['balance_mills'] = wallet.get('balance_mills', 0) + refund_mills
-                    write_json_atomic(WALLET_PATH, wallet)
-                    try:
-                        write_wallet_to_sheet(wallet['balance_mills'])
-                    except Exception:
-                        pass
-                job['status'] = 'completed'
-                job['sent_segments'] = sent_segments
-                job['failed_segments'] = failed_segments
-                job['actual_cost_mills'] = actual_cost_mills
-                job['refund_mills'] = refund_mills
-                job['completedAt'] = datetime.utcnow().isoformat() + 'Z'
-                write_json_atomic(JOBS_PATH, jobs)
-        print(f"[worker-thread] Completed job {job_id}: sent={sent_segments} failed={failed_segments}")
+        conn = get_db()
+        if not acquire_job(conn, job_id):
+            print(f"[worker-thread] job {job_id} is completed or owned by another process, skipping")
+            return
+        print(f"[worker-thread] Starting job {job_id}")
+        run_job(conn, job_id)
     finally:
-        running_jobs.discard(job_id)
+        with running_jobs_lock:
+            running_jobs.discard(job_id)
+
+def run_job(conn, job_id):
+    def record(done):
+        sent, failed = [], []
+        for fut in done:
+            rec_id, segs, tw_sid, sent_at, err = fut.result()
+            if err is None:
+                sent.append((tw_sid, sent_at, rec_id))
+            else:
+                failed.append((err, rec_id))
+        if sent:
+            conn.executemany(
+                "UPDATE recipients SET twilioSid = ?, status = 'sent', lastSend = ? WHERE id = ?", sent)
+        if failed:
+            conn.executemany(
+                "UPDATE recipients SET lastError = ?, status = 'failed' WHERE id = ?", failed)
+
+    owned = True
+    next_heartbeat = time.monotonic() + JOB_HEARTBEAT_S
+    with ThreadPoolExecutor(max_workers=SEND_CONCURRENCY, thread_name_prefix='sender') as pool:
+        pending = set()
+        done = ()
+        while True:
+            claimed_at = utc_now_iso()
+            claimed = ()
+            with conn:
+                record(done)
+                if owned and time.monotonic() >= next_heartbeat:
+                    owned = renew_job_lease(conn, job_id)
+                    next_heartbeat = time.monotonic() + JOB_HEARTBEAT_S
+                    if not owned:
+                        print(f"[worker-thread] lost the lease on job {job_id}, finishing in-flight sends only")
+                if owned:
+                    # claim + mark sending in a single statement: no window for another writer.
+                    # only as many as there are free senders, so 'sending' means actually in flight
+                    claimed = conn.execute(
+                        "UPDATE recipients SET status = 'sending', attempts = attempts + 1, lastAttemptAt = ?"
+                        " WHERE id IN (SELECT id FROM recipients WHERE jobId = ? AND status = 'queued'"
+                        " ORDER BY rowid LIMIT ?)"
+                        " RETURNING id, phone, message, segments",
+                        (claimed_at, job_id, SEND_CONCURRENCY - len(pending))).fetchall()
+            for rec in claimed:
+                pending.add(pool.submit(send_to_recipient, rec))
+            if not pending:
+                break
+            # wake up at least once per heartbeat even while every send is still in flight
+            done, pending = wait(pending, timeout=JOB_HEARTBEAT_S, return_when=FIRST_COMPLETED)
+
+    if owned:
+        finalize_job(conn, job_id)
+
+def finalize_job(conn, job_id):
+    """
+    Marks the job completed and refunds the unspent reservation, at most once: only the
+    lease holder can flip it to 'completed', and the cost comes from the recipients'
+    stored statuses rather than from any one process's counters.
+    """
+    completed_at = utc_now_iso()
+    with conn:
+        job = conn.execute(
+            "UPDATE jobs SET status = 'completed', completedAt = ?, ownerPid = NULL, leaseUntil = NULL"
+            " WHERE id = ? AND ownerPid = ? AND status != 'completed' RETURNING totalCost_mills",
+            (completed_at, job_id, os.getpid())).fetchone()
+        if job is None:
+            return
+        sent_segments, failed_segments = conn.execute(
+            "SELECT COALESCE(SUM(CASE WHEN status IN ('sent', 'delivered') THEN segments END), 0),"
+            " COALESCE(SUM(CASE WHEN status = 'failed' THEN segments END), 0)"
+            ' FROM recipients WHERE jobId = ?', (job_id,)).fetchone()
+        reserved_mills = job['totalCost_mills'] or 0
+        actual_cost_mills = sent_segments * PRICE_PER_SMS_MILLS
+        refund_mills = max(0, reserved_mills - actual_cost_mills)
+        if refund_mills > 0:
+            # atomic increment, no read-modify-write in Python
+            conn.execute('UPDATE wallet SET balance_mills = balance_mills + ? WHERE id = 1', (refund_mills,))
+        conn.execute(
+            'UPDATE jobs SET sent_segments = ?, failed_segments = ?, actual_cost_mills = ?, refund_mills = ?'
+            ' WHERE id = ?',
+            (sent_segments, failed_segments, actual_cost_mills, refund_mills, job_id))
+    if refund_mills > 0:
+        request_sheet_sync()
+    print(f"[worker-thread] Completed job {job_id}: sent={sent_segments} failed={failed_segments}")
+
 
 
+# a fixed set of long-lived job threads drains one queue, so a burst of uploads
+# queues up instead of spawning a thread (and a sender pool) per job
+JOB_QUEUE = queue.Queue()
+_job_workers_started = False
+_job_workers_lock = Lock()
+
+def job_worker_loop():
+    while True:
+        job_id = JOB_QUEUE.get()
+        try:
+            process_job(job_id)
+        except Exception as e:
+            print(f"[worker-thread] job {job_id} failed:", e)
+
+def ensure_job_workers():
+    global _job_workers_started
+    with _job_workers_lock:
+        if _job_workers_started:
+            return
+        _job_workers_started = True
+    for i in range(JOB_WORKERS):
+        threading.Thread(target=job_worker_loop, name=f'job-worker-{i}', daemon=True).start()
+
+def _reset_job_workers_after_fork():
+    # threads don't survive fork: a child starts its own workers on an empty queue
+    # rather than inheriting job ids the parent has already handed out
+    global JOB_QUEUE, _job_workers_started, _job_workers_lock
+    JOB_QUEUE = queue.Queue()
+    _job_workers_started = False
+    _job_workers_lock = Lock()
+
+os.register_at_fork(after_in_child=_reset_job_workers_after_fork)
 
 def start_background_worker_for(job_id):
-    t = threading.Thread(target=process_job, args=(job_id,), daemon=True)
-    t.start()
-    return t
-
-# On startup: resume any queued recipients (safety/resume)
-def resume_pending_jobs_on_startup():
-    with fs_lock:
-        recips = read_json(RECIPS_PATH)
-        pending_job_ids = sorted({r['jobId'] for r in recips if r.get('status') in ('queued', 'sending')})
-    for jid in pending_job_ids:
-        print(f"[startup] Resuming pending job {jid}")
-        start_background_worker_for(jid)
-
-# schedule resume once when app starts
-resume_pending_jobs_on_startup()
+    ensure_job_workers()
+    JOB_QUEUE.put(job_id)
+
+# resume any queued recipients whose job has no live owner (safety/resume)
+def resume_orphaned_jobs():
+    """
+    Queues every unfinished job that no live process is sending: never claimed, or
+    its owner's lease has expired. Jobs a live worker is still running are left alone;
+    process_job re-checks ownership, so a job queued twice still runs once.
+    """
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT DISTINCT jobId FROM recipients WHERE status IN ('queued', 'sending')"
+        ' AND jobId IN (SELECT id FROM jobs WHERE ownerPid IS NULL OR leaseUntil < ?)'
+        ' ORDER BY jobId', (time.time(),)).fetchall()
+    for r in rows:
+        print(f"[resume] Resuming orphaned job {r['jobId']}")
+        start_background_worker_for(r['jobId'])
+
+def resume_loop():
+    # at startup, then once per lease period: catches the jobs of a worker that died
+    # while the others kept running (its leases expire, nobody restarts it for us)
+    while True:
+        try:
+            resume_orphaned_jobs()
+        except Exception as e:
+            print("[resume] scan failed:", e)
+        time.sleep(JOB_LEASE_S)
+
+RESUME_LOCK_PATH = os.path.join(DATA_DIR, 'resume.lock')
+_resume_lock_file = None
+
+def resume_pending_jobs_once():
+    """
+    Starts resume_loop() in exactly one process. The first caller to take an exclusive
+    flock on RESUME_LOCK_PATH wins and keeps it for its lifetime; every other process
+    (other gunicorn workers, the dev reloader's child) skips. If the winner dies, the
+    worker gunicorn forks to replace it takes over. Called from gunicorn's post_fork
+    hook and from the __main__ block.
+    """
+    global _resume_lock_file
+    if _resume_lock_file is not None:
+        return True
+    f = open(RESUME_LOCK_PATH, 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+    _resume_lock_file = f
+    threading.Thread(target=resume_loop, name='job-resume', daemon=True).start()
+    return True
+
+# -----------------------
+# Background writer
+# -----------------------
+# one thread owns bulk inserts and webhook status updates so HTTP handlers
+# don't wait on disk I/O
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+_status_queue = queue.Queue()
+STATUS_BATCH_WINDOW_S = 0.05
+STATUS_BATCH_MAX = 64
+
+def reserve_job(job, recip_rows):
+    """
+    Debits the wallet and inserts the job and all of its recipients in one
+    BEGIN IMMEDIATE transaction, then queues the job. recip_rows are
+    (id, jobId, phone, message, segments, createdAt) tuples with distinct phones
+    (classify_rows dedupes them; UNIQUE(jobId, phone) makes a repeat fail the whole
+    transaction). Returns False, with nothing written, when the balance doesn't
+    cover the cost.
+    """
+    conn = get_db()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        # owned by this process from the start, so the resume scan leaves it alone
+        # while it waits in JOB_QUEUE (unless this process dies first)
+        insert_rows(conn, 'jobs', JOB_COLUMNS + JOB_LEASE_COLUMNS,
+                    [dict(job, ownerPid=os.getpid(), leaseUntil=time.time() + JOB_LEASE_S)])
+        conn.executemany(
+            "INSERT INTO recipients (id, jobId, phone, message, segments, status, attempts, createdAt)"
+            " VALUES (?, ?, ?, ?, ?, 'queued', 0, ?)", recip_rows)
+        # debit only if the balance covers the cost (check + debit in one statement)
+        cur = conn.execute('UPDATE wallet SET balance_mills = balance_mills - ? WHERE id = 1 AND balance_mills >= ?',
+                           (job['totalCost_mills'], job['totalCost_mills']))
+        if cur.rowcount == 0:
+            conn.rollback()
+            return False
+    start_background_worker_for(job['id'])
+    return True
+
+def apply_status_updates():
+    """
+    Collects webhook events for up to STATUS_BATCH_WINDOW_S (or STATUS_BATCH_MAX events)
+    and applies them in one transaction. A burst of callbacks is usually handled by the
+    first task; later ones find the queue empty.
+    """
+    try:
+        events = [_status_queue.get_nowait()]
+    except queue.Empty:
+        return
+    deadline = time.monotonic() + STATUS_BATCH_WINDOW_S
+    while len(events) < STATUS_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            events.append(_status_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    # only the latest callback per MessageSid matters; sid-less events are kept as-is
+    by_sid = {}
+    for i, e in enumerate(events):
+        by_sid[e[0] or i] = e
+    # one timestamp for the whole batch, taken before the lock
+    now = utc_now_iso()
+    try:
+        conn = get_db()
+        with conn:
+            for sid, status, to in by_sid.values():
+                updated = 0
+                if sid:
+                    # direct index hit on twilioSid, no separate lookup
+                    updated = conn.execute(
+                        f'UPDATE recipients SET {STATUS_UPDATE_SET} WHERE twilioSid = ?3',
+                        (status, now, sid)).rowcount
+                if not updated and to:
+                    conn.execute(
+                        f'UPDATE recipients SET {STATUS_UPDATE_SET}'
+                        " WHERE rowid = (SELECT rowid FROM recipients WHERE phone = ?3 AND status IN ('queued', 'sending', 'sent')"
+                        ' ORDER BY rowid LIMIT 1)',
+                        (status, now, to))
+    except Exception as e:
+        print(f"[writer] failed to apply {len(events)} status update(s):", e)
+
+# don't carry an open SQLite handle from the import thread across a fork
+close_db()
 
 # -----------------------
 # HTTP endpoints
@@ -356,121 +1036,134 @@ def index():
 
 @app.route('/api/estimate', methods=['POST'])
 def api_estimate():
-    payload = request.get_json(force=True)
-    csv_text = payload.get('csv') or ''
+    csv_text = ''
+    csv_stream = None
+    if request.mimetype == 'text/csv':
+        # raw CSV body, parsed straight off the request stream (optionally gzip'd);
+        # the other options come from the query string
+        payload = request.args
+        body = request.stream
+        if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.GzipFile(fileobj=body)
+        # servers hand over different file-like types (gunicorn's isn't io-compatible),
+        # but all support readline(size); decode the lines incrementally
+        csv_stream = codecs.iterdecode(iter_lines_capped(body, MAX_CSV_BYTES), 'utf-8-sig')
+        do_send = payload.get('send') == 'true'
+    elif (upload := request.files.get('csv')) is not None:
+        # multipart/form-data upload: form fields mirror the JSON body
+        payload = request.form
+        try:
+            csv_text = read_upload_text(upload)
+        except UnicodeDecodeError:
+            return jsonify(error='CSV must be UTF-8'), 400
+        do_send = payload.get('send') == 'true'
+    else:
+        if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+            # compressed JSON body: CSVs shrink several-fold, so big uploads are much cheaper to send
+            try:
+                body = gunzip_capped(request.get_data(), MAX_CSV_BYTES)
+                if body is None:
+                    return jsonify(error='body too large once decompressed', limit_bytes=MAX_CSV_BYTES), 413
+                payload = orjson.loads(body)
+            except (OSError, EOFError, zlib.error, ValueError):
+                return jsonify(error='invalid gzip JSON body'), 400
+        else:
+            payload = request.get_json(force=True)
+        csv_text = payload.get('csv') or ''
+        do_send = payload.get('send') is True
     template = payload.get('template') or ''
     default_country = payload.get('defaultCountry') or 'CA'
-    do_send = payload.get('send') is True
 
-    if not csv_text:
+    if not csv_text and csv_stream is None:
         return jsonify(error='CSV missing'), 400
 
     try:
-        reader = csv.DictReader(csv_text.splitlines())
-        rows = [r for r in reader if any((v or '').strip() for v in r.values())]
+        if csv_stream is not None:
+            fieldnames, reader = read_csv_stream(csv_stream)
+            if fieldnames is None:
+                return jsonify(error='CSV missing'), 400
+        else:
+            fieldnames, reader = read_csv_rows(csv_text)
+    except CSVTooLarge as e:
+        return jsonify(error=str(e)), 413
     except Exception as e:
         return jsonify(error='CSV parse error: ' + str(e)), 400
 
-    parsed = []
-    total_segments = 0
-    rejected = []
-    seen_phones = set()
-    for r in rows:
-        raw_phone = (r.get('phone') or r.get('phone_number') or r.get('mobile') or r.get('msisdn') or '').strip()
-        if not raw_phone:
-            rejected.append({'row': r, 'reason': 'phone missing'})
-            continue
-        phone, err = normalize_phone_and_check_canada(raw_phone, default_country)
-        if err:
-            rejected.append({'row': r, 'reason': err})
-            continue
-        # dedupe per job: skip if same phone already present
-        if phone in seen_phones:
-            # keep only first occurrence
-            continue
-        seen_phones.add(phone)
+    # template is split once; each row is a single join
+    render_message = template_renderer(template, fieldnames)
+    get_phone = phone_getter(fieldnames)
 
-        if (r.get('message') or '').strip():
-            message = r.get('message').strip()
-        else:
-            message = template
-            for k, v in r.items():
-                message = message.replace('{{' + k + '}}', v or '')
-        seg = segments_for_text(message)
-        total_segments += seg
-        parsed.append({'phone': phone, 'message': message, 'segments': seg, 'original': r})
+    classified = classify_rows(reader, get_phone, render_message, default_country)
+
+    if not do_send and 'application/x-ndjson' in request.headers.get('Accept', ''):
+        # streamed preview: the client can render rows while the rest is still parsing
+        return Response(stream_with_context(stream_estimate_ndjson(classified)),
+                        mimetype='application/x-ndjson')
 
+    # one pass over the rows into parallel columns; per-row dicts are only built
+    # for whichever output needs them (preview rows or recipient records)
+    phones = []
+    messages = []
+    originals = []
+    rejected = []
+    try:
+        for phone, message, r, reason in classified:
+            if reason is not None:
+                rejected.append({'row': r, 'reason': reason})
+                continue
+            phones.append(phone)
+            messages.append(message)
+            originals.append(r)
+    except CSVTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except (csv.Error, UnicodeDecodeError, OSError, EOFError, zlib.error) as e:
+        # a streamed body can also fail mid-way on bad UTF-8 or a corrupt gzip stream
+        return jsonify(error='CSV parse error: ' + str(e)), 400
+
+    # segment counting in one batch after the row loop
+    segs = segments_for_texts(messages)
+    total_segments = sum(segs)
     total_cost_mills = total_segments * PRICE_PER_SMS_MILLS
 
     if not do_send:
+        parsed = [{'phone': phone, 'message': message, 'original': r, 'segments': seg}
+                  for phone, message, r, seg in zip(phones, messages, originals, segs)]
         return jsonify(rows=parsed, totalSegments=total_segments,
                        totalCost_mills=total_cost_mills, totalCost_usd=mills_to_usd_string(total_cost_mills),
                        rejected=rejected)
 
     # reserve wallet and create job & recipients, then start background processing
-    with fs_lock:
-        wallet = read_json(WALLET_PATH)
-        if wallet.get('balance_mills', 0) < total_cost_mills:
-            return jsonify(error='Insufficient wallet balance', required_mills=total_cost_mills,
-                           required_usd=mills_to_usd_string(total_cost_mills)), 402
-        wallet['balance_mills'] = wallet.get('balance_mills', 0) - total_cost_mills
-        write_json_atomic(WALLET_PATH, wallet)
-
-        jobs = read_json(JOBS_PATH)
-        job_id = str(uuid.uuid4())
-        job = {
-            "id": job_id,
-            "totalRecipients": len(parsed),
-            "totalSegments": total_segments,
-            "totalCost_mills": total_cost_mills,
-            "totalCost_usd": mills_to_usd_string(total_cost_mills),
-            "pricePerSegment_mills": PRICE_PER_SMS_MILLS,
-            "pricePerSegment_usd": mills_to_usd_string(PRICE_PER_SMS_MILLS),
-            "status": "queued",
-            "createdAt": datetime.utcnow().isoformat() + 'Z'
-        }
-        jobs.append(job)
-        write_json_atomic(JOBS_PATH, jobs)
-
-        recips = read_json(RECIPS_PATH)
-        now = datetime.utcnow().isoformat() + 'Z'
-        for p in parsed:
-            recips.append({
-                "id": str(uuid.uuid4()),
-                "jobId": job_id,
-                "phone": p['phone'],
-                "message": p['message'],
-                "segments": p['segments'],
-                "status": "queued",
-                "attempts": 0,
-                "createdAt": now
-            })
-        write_json_atomic(RECIPS_PATH, recips)
-
-    # start background worker thread and return immediately
-    start_background_worker_for(job_id)
-
-    return jsonify(ok=True, jobId=job_id, totalCost_mills=total_cost_mills,
-                   totalCost_usd=mills_to_usd_string(total_cost_mills), rejected=rejected)
+    now = utc_now_iso()
+    job_id = str(uuid.uuid4())
+    job = {
+        "id": job_id,
+        "totalRecipients": len(phones),
+        "totalSegments": total_segments,
+        "totalCost_mills": total_cost_mills,
+        "totalCost_usd": mills_to_usd_string(total_cost_mills),
+        "pricePerSegment_mills": PRICE_PER_SMS_MILLS,
+        "pricePerSegment_usd": mills_to_usd_string(PRICE_PER_SMS_MILLS),
+        "status": "queued",
+        "createdAt": now
+    }
+    recip_rows = [(rec_id, job_id, phone, message, seg, now)
+                  for rec_id, phone, message, seg in zip(uuid4_batch(len(phones)), phones, messages, segs)]
+
+    # wallet debit + job + recipients commit together on the writer thread (the
+    # only thread that writes bulk rows), so a reservation is never half-applied
+    if not _writer.submit(reserve_job, job, recip_rows).result():
+        return jsonify(error='Insufficient wallet balance', required_mills=job['totalCost_mills'],
+                       required_usd=job['totalCost_usd']), 402
+    request_sheet_sync()
+
+    return jsonify(ok=True, jobId=job_id, totalCost_mills=job['totalCost_mills'],
+                   totalCost_usd=job['totalCost_usd'], rejected=rejected), 202
 
 
 @app.route('/api/wallet', methods=['GET'])
 def api_wallet():
-    # try read from sheet first (if configured)
-    sheet_mills = None
-    try:
-        sheet_mills = read_wallet_from_sheet()
-    except Exception:
-        sheet_mills = None
-
-    if sheet_mills is not None:
-        # persist locally as well
-        with fs_lock:
-            write_json_atomic(WALLET_PATH, {"balance_mills": int(sheet_mills)})
-        balance_mills = int(sheet_mills)
-    else:
-        wallet = read_json(WALLET_PATH)
-        balance_mills = wallet.get('balance_mills', 0)
+    # local database only; the sheet mirror is kept up to date by sheet_sync_loop
+    balance_mills = get_wallet_mills(get_db())
     return jsonify(balance_mills=balance_mills, balance_usd=mills_to_usd_string(balance_mills))
 
 
@@ -483,16 +1176,12 @@ def api_topup():
     amount_mills = int(body.get('amount_mills') or 0)
     if amount_mills == 0:
         return jsonify(error='amount_mills required (non-zero integer)'), 400
-    with fs_lock:
-        wallet = read_json(WALLET_PATH)
-        wallet['balance_mills'] = wallet.get('balance_mills', 0) + amount_mills
-        write_json_atomic(WALLET_PATH, wallet)
-        # update Google Sheet if configured
-        try:
-            write_wallet_to_sheet(wallet['balance_mills'])
-        except Exception:
-            pass
-    return jsonify(ok=True, balance_mills=wallet['balance_mills'], balance_usd=mills_to_usd_string(wallet['balance_mills']))
+    conn = get_db()
+    with conn:
+        conn.execute('UPDATE wallet SET balance_mills = balance_mills + ? WHERE id = 1', (amount_mills,))
+        balance_mills = get_wallet_mills(conn)
+    request_sheet_sync()
+    return jsonify(ok=True, balance_mills=balance_mills, balance_usd=mills_to_usd_string(balance_mills))
 
 
 @app.route('/api/twilio/status', methods=['POST'])
@@ -504,45 +1193,38 @@ def api_twilio_status():
     if not sid and not to:
         return '', 200
 
-    with fs_lock:
-        recips = read_json(RECIPS_PATH)
-        found = None
-        if sid:
-            for r in recips:
-                if r.get('twilioSid') == sid:
-                    found = r
-                    break
-        if not found and to:
-            for r in recips:
-                if r.get('phone') == to and r.get('status') in ('queued', 'sending', 'sent'):
-                    found = r
-                    break
-        if found:
-            found['twilioStatus'] = status
-            if status == 'delivered':
-                found['status'] = 'delivered'
-            elif status in ('failed', 'undelivered'):
-                found['status'] = 'failed'
-            elif status == 'sent':
-                found['status'] = 'sent'
-            found['updatedAt'] = datetime.utcnow().isoformat() + 'Z'
-            write_json_atomic(RECIPS_PATH, recips)
+    # applied by the writer thread; ack Twilio without waiting on the database
+    _status_queue.put((sid, status, to))
+    _writer.submit(apply_status_updates)
     return '', 200
 
 @app.route('/api/job/<job_id>', methods=['GET'])
 def api_job(job_id):
-    jobs = read_json(JOBS_PATH)
-    job = next((j for j in jobs if j.get('id') == job_id), None)
+    conn = get_db()
+    job = conn.execute('SELECT %s FROM jobs WHERE id = ?' % ','.join(JOB_COLUMNS), (job_id,)).fetchone()
     if not job:
         return jsonify(error='job not found'), 404
-    recips = read_json(RECIPS_PATH)
-    job_recs = [r for r in recips if r.get('jobId') == job_id]
-    return jsonify(job=job, recipients=job_recs)
+
+    def generate():
+        # stream one recipient at a time straight off the cursor instead of
+        # materializing the whole list (and a second copy in jsonify)
+        yield b'{"job":' + orjson.dumps(row_to_dict(job)) + b',"recipients":['
+        cur = conn.execute('SELECT * FROM recipients WHERE jobId = ? ORDER BY rowid', (job_id,))
+        sep = b''
+        for r in cur:
+            yield sep + orjson.dumps(row_to_dict(r))
+            sep = b','
+        yield b']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/static/<path:filename>')
 def static_files(filename):
     return send_from_directory('static', filename)
 
 if __name__ == '__main__':
+    # local development only; production runs `gunicorn app:app` (see gunicorn.conf.py)
+    print("[dev] Werkzeug dev server; use `gunicorn app:app` in production")
+    resume_pending_jobs_once()
     port = int(os.getenv('PORT', '5000'))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)
@@ -0,0 +1,152 @@
+# db.py — SQLite storage for the wallet, jobs and recipients
+import os
+import sqlite3
+import threading
+import orjson
+
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+
+DB_PATH = os.path.join(DATA_DIR, 'app.db')
+# legacy JSON stores, imported into the database once on first start
+WALLET_PATH = os.path.join(DATA_DIR, 'wallet.json')
+JOBS_PATH = os.path.join(DATA_DIR, 'jobs.json')
+RECIPS_PATH = os.path.join(DATA_DIR, 'recipients.json')
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+# ---------- SQLite storage helpers ----------
+# column names mirror the keys of the old JSON documents so API responses keep their shape
+JOB_COLUMNS = ('id', 'totalRecipients', 'totalSegments', 'totalCost_mills', 'totalCost_usd',
+               'pricePerSegment_mills', 'pricePerSegment_usd', 'status', 'createdAt',
+               'sent_segments', 'failed_segments', 'actual_cost_mills', 'refund_mills', 'completedAt')
+RECIP_COLUMNS = ('id', 'jobId', 'phone', 'message', 'segments', 'status', 'attempts',
+                 'lastAttemptAt', 'lastSend', 'lastError', 'twilioSid', 'twilioStatus',
+                 'createdAt', 'updatedAt')
+# which process is sending a job and until when its claim holds (epoch seconds); kept
+# out of JOB_COLUMNS so they never show up in API responses
+JOB_LEASE_COLUMNS = ('ownerPid', 'leaseUntil')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wallet (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    balance_mills INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    totalRecipients INTEGER,
+    totalSegments INTEGER,
+    totalCost_mills INTEGER,
+    totalCost_usd TEXT,
+    pricePerSegment_mills INTEGER,
+    pricePerSegment_usd TEXT,
+    status TEXT,
+    createdAt TEXT,
+    sent_segments INTEGER,
+    failed_segments INTEGER,
+    actual_cost_mills INTEGER,
+    refund_mills INTEGER,
+    completedAt TEXT,
+    ownerPid INTEGER,
+    leaseUntil REAL
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    id TEXT PRIMARY KEY,
+    jobId TEXT NOT NULL,
+    phone TEXT,
+    message TEXT,
+    segments INTEGER,
+    status TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lastAttemptAt TEXT,
+    lastSend TEXT,
+    lastError TEXT,
+    twilioSid TEXT,
+    twilioStatus TEXT,
+    createdAt TEXT,
+    updatedAt TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_recips_sid ON recipients(twilioSid);
+CREATE INDEX IF NOT EXISTS ix_recips_phone_status ON recipients(phone, status);
+CREATE INDEX IF NOT EXISTS ix_recips_job_status ON recipients(jobId, status);
+-- a number is messaged at most once per job, whatever the caller sends
+CREATE UNIQUE INDEX IF NOT EXISTS ix_recips_job_phone ON recipients(jobId, phone);
+-- only unfinished rows: the resume scan reads this instead of the whole table
+CREATE INDEX IF NOT EXISTS ix_recips_pending ON recipients(status, jobId) WHERE status IN ('queued', 'sending');
+"""
+
+WAL_AUTOCHECKPOINT = int(os.getenv('WAL_AUTOCHECKPOINT', '1000'))  # pages
+WAL_SIZE_LIMIT = 64 * 1024 * 1024  # bytes kept for the -wal file after a checkpoint
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes, 0 disables
+
+_db_local = threading.local()
+
+def get_db():
+    """
+    Returns this thread's SQLite connection, opening it on first use.
+    Connections run in WAL mode so readers don't block the writer.
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # the WAL is our append-only log: checkpoint (compact) it into the main file
+        # every WAL_AUTOCHECKPOINT pages and truncate it back down afterwards
+        conn.execute('PRAGMA wal_autocheckpoint=%d' % WAL_AUTOCHECKPOINT)
+        conn.execute('PRAGMA journal_size_limit=%d' % WAL_SIZE_LIMIT)
+        # read pages straight from the OS page cache instead of copying them through read()
+        conn.execute('PRAGMA mmap_size=%d' % DB_MMAP_SIZE)
+        _db_local.conn = conn
+    return conn
+
+def row_to_dict(row):
+    # drop NULL columns, matching the old JSON documents where unset keys were absent
+    return {k: row[k] for k in row.keys() if row[k] is not None}
+
+def insert_rows(conn, table, columns, docs):
+    docs = list(docs)
+    if not docs:
+        return
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ','.join(columns), ','.join('?' * len(columns)))
+    conn.executemany(sql, [tuple(d.get(c) for c in columns) for d in docs])
+
+def init_db():
+    """
+    Creates the schema and seeds the wallet. On first start, imports
+    wallet/jobs/recipients from the legacy JSON files if they exist.
+    """
+    conn = get_db()
+    with conn:
+        conn.executescript(SCHEMA)
+        # databases created before job leases existed
+        have = {r['name'] for r in conn.execute('PRAGMA table_info(jobs)')}
+        for col, decl in zip(JOB_LEASE_COLUMNS, ('INTEGER', 'REAL')):
+            if col not in have:
+                conn.execute('ALTER TABLE jobs ADD COLUMN %s %s' % (col, decl))
+        if conn.execute('SELECT 1 FROM wallet WHERE id = 1').fetchone():
+            return
+        # wallet uses mills: 1 mill = $0.001
+        balance_mills = 100000
+        if os.path.exists(WALLET_PATH):
+            balance_mills = int(read_json(WALLET_PATH).get('balance_mills', 0))
+        conn.execute('INSERT INTO wallet (id, balance_mills) VALUES (1, ?)', (balance_mills,))
+        if os.path.exists(JOBS_PATH):
+            insert_rows(conn, 'jobs', JOB_COLUMNS, read_json(JOBS_PATH))
+        if os.path.exists(RECIPS_PATH):
+            insert_rows(conn, 'recipients', RECIP_COLUMNS, read_json(RECIPS_PATH))
+
+def close_db():
+    # close this thread's connection (e.g. before gunicorn forks workers from a preloaded app)
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _db_local.conn = None
+
+def get_wallet_mills(conn):
+    row = conn.execute('SELECT balance_mills FROM wallet WHERE id = 1').fetchone()
+    return row['balance_mills'] if row else 0
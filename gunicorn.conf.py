@@ -0,0 +1,25 @@
+# gunicorn.conf.py — picked up automatically by `gunicorn app:app`
+import os
+
+bind = '0.0.0.0:' + os.getenv('PORT', '5000')
+
+# threaded workers: webhook callbacks and CSV estimates run concurrently with sends.
+# One process by default: the work is I/O-bound (threads suffice), SQLite has a single
+# writer, and send pacing (SEND_MPS, 429 backoff) is per process, so each extra worker
+# adds another SEND_MPS of account-wide send rate. Lower SEND_MPS if you raise this.
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+keepalive = 30
+
+# import app.py once in the master so phonenumbers metadata and the other
+# module-level setup are shared copy-on-write across workers
+preload_app = True
+
+
+def post_fork(server, worker):
+    # one worker scans for orphaned jobs (flock election in app.py); a respawned
+    # worker inherits the election if the scanning worker dies
+    from app import resume_pending_jobs_once
+    if resume_pending_jobs_once():
+        server.log.info('worker %s is resuming orphaned jobs', worker.pid)